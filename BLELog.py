@@ -16,6 +16,12 @@ import signal
 import sys
 from asyncio import Event
 
+try:
+    # Faster drop-in event loop. Not available under Windows.
+    import uvloop
+except ImportError:
+    uvloop = None
+
 import blelog.Logging as Logging
 import config
 from blelog.ConnectionMgr import ConnectionMgr
@@ -110,4 +116,6 @@ async def main():
     await asyncio.gather(scnr_task, con_mgr_task, tui_task, consume_mgr_task)
 
 if __name__ == '__main__':
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     asyncio.run(main(), debug=True)
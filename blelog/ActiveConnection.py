@@ -11,13 +11,11 @@ included LICENSE file or <https://opensource.org/licenses/MIT>.
 """
 import asyncio
 import enum
-import functools
 import logging
 import time
 from asyncio import Event
-from asyncio.queues import Queue, QueueFull
 from enum import Enum
-from typing import Dict, Union
+from typing import List, Tuple, Union
 
 from bleak import BleakClient
 from bleak.backends.characteristic import BleakGATTCharacteristic
@@ -25,6 +23,15 @@ from bleak.exc import BleakDBusError, BleakError
 
 from blelog.Configuration import Characteristic, Configuration
 from blelog.ConsumerMgr import NotifData
+from blelog.FastQueue import FastQueue
+
+log = logging.getLogger('log')
+
+# Maximum number of raw notifications waiting to be decoded, per connection:
+raw_q_maxsize = 1000
+
+# Minimum time between warnings about dropped notifications:
+drop_warn_interval_ns = 1e9
 
 
 @enum.unique
@@ -41,8 +48,31 @@ class ActiveConnectionException(Exception):
     pass
 
 
+class _NotifDispatcher:
+    """
+    Notification callback for a single characteristic of a connection.
+    Records the time of the notification, and hands the raw data to the
+    connection's decoder task.
+    """
+    __slots__ = ('char', 'char_idx', 'put', 'last_notif')
+
+    def __init__(self, conn: 'ActiveConnection', char: Characteristic) -> None:
+        self.char = char
+        self.char_idx = char.idx
+        self.put = conn._raw_q.put_nowait
+        self.last_notif = conn.last_notif
+
+    def __call__(self, dev: BleakGATTCharacteristic, data: bytearray) -> None:
+        _ = dev
+
+        self.last_notif[self.char_idx] = time.monotonic_ns()
+
+        # Hand off to the decoder task:
+        self.put((self.char, data), self.char.drop_policy)
+
+
 class ActiveConnection:
-    def __init__(self, adr: str, name: str, config: Configuration, output: Queue) -> None:
+    def __init__(self, adr: str, name: str, config: Configuration, output: FastQueue) -> None:
         self.adr = adr
         self.name = name
         self.config = config
@@ -51,17 +81,39 @@ class ActiveConnection:
         self.did_disconnect = False
 
         self.output = output
+        self._put = output.put_nowait
+
+        # Raw notifications, waiting to be decoded by the decoder task:
+        self._raw_q = FastQueue(maxsize=raw_q_maxsize)
+        self._decoder_task = None  # type: Union[asyncio.Task, None]
+        self._last_drop_warning = None  # type: Union[None, int]
 
         self.con = None  # type: Union[BleakClient, None]
 
         self.initial_connection_time = None
-        self.last_notif = {c.uuid: None for c in config.characteristics}  # type: Dict[str, Union[None, int]]
+        self._last_active_s = None  # type: Union[None, int]
+        self._last_active_str = None  # type: Union[None, str]
+
+        # Time of last notification, indexed by characteristic index:
+        self.last_notif = [None] * len(config.characteristics)  # type: List[Union[None, int]]
+
+        # Only characteristics with a timeout need to be checked:
+        self._timed_chars = tuple(c for c in config.characteristics if c.timeout_ns is not None)
+
+        if config.initial_characteristic_timeout is not None:
+            self._initial_timeout_ns = int(config.initial_characteristic_timeout * 1e9)
+        else:
+            self._initial_timeout_ns = None
 
-        self.log = logging.getLogger('log')
+        # Set to wake up the main loop in `run` (on disconnect or halt):
+        self._wake = Event()
+        self._loop = None  # type: Union[asyncio.AbstractEventLoop, None]
 
     async def run(self, halt: Event) -> None:
-        log = logging.getLogger('log')
+        halt_waiter = None
         try:
+            self._loop = asyncio.get_running_loop()
+
             con = BleakClient(
                 self.adr,
                 timeout=self.config.connection_timeout_scan,
@@ -79,24 +131,41 @@ class ActiveConnection:
                 await self._connect(self.con)
                 self.initial_connection_time = time.monotonic_ns()
 
+                # Wake up the loop below as soon as a halt is requested:
+                halt_waiter = asyncio.create_task(halt.wait())
+                halt_waiter.add_done_callback(lambda _: self._wake.set())
+
                 while not halt.is_set():
+                    self._wake.clear()
+
                     # Check for disconnection
                     # (Flag set by disconnect callback or when this connection is manually disconnected)
                     if self.did_disconnect:
-                        log.warning('Connection to %s lost!' % self.name)
+                        log.warning('Connection to %s lost!', self.name)
                         raise ActiveConnectionException()
 
-                    await self._check_for_timeout()
+                    if self._timed_chars:
+                        next_timeout = await self._check_for_timeout()
+                    else:
+                        next_timeout = None
 
-                    await asyncio.sleep(0.05)
+                    # Sleep until the next characteristic timeout could expire, or until woken
+                    # up by a disconnect or halt:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=next_timeout)
+                    except asyncio.TimeoutError:
+                        pass
 
             except ActiveConnectionException:
                 pass
             finally:
+                if halt_waiter is not None:
+                    halt_waiter.cancel()
                 await self._do_disconnect()
+                await self._stop_decoder()
 
         except Exception as e:
-            log.error('Connection %s encountered an exception: %s' % (self.name, str(e)))
+            log.error('Connection %s encountered an exception: %s', self.name, e)
             log.exception(e)
             self.did_disconnect = True
         finally:
@@ -105,113 +174,168 @@ class ActiveConnection:
                 print('Connection %s shut down...' % self.name)
 
     async def _connect(self, con: BleakClient) -> None:
-        log = logging.getLogger('log')
-
         # Note: According to the docks, bleak generates exceptions if connecting fails under linux,
         # while only returning false on other platforms.
         # This should handle all cases.
         try:
             ok = await asyncio.wait_for(con.connect(), self.config.connection_timeout_hard)
             if not ok:
-                log.warning('Failed to connect to %s!' % self.name)
+                log.warning('Failed to connect to %s!', self.name)
                 raise ActiveConnectionException()
         except BleakDBusError as e:
-            log.warning('Failed to connect to %s: DBus Error.' % self.name)
+            log.warning('Failed to connect to %s: DBus Error.', self.name)
             log.exception(e)
             raise ActiveConnectionException()
         except BleakError as e:
-            log.warning('Failed to connect to %s: %s' % (self.name, e))
+            log.warning('Failed to connect to %s: %s', self.name, e)
             log.exception(e)
             raise ActiveConnectionException()
         except asyncio.TimeoutError:
-            log.warning('Failed to connect to %s: Timeout' % self.name)
+            log.warning('Failed to connect to %s: Timeout', self.name)
             raise ActiveConnectionException()
         except OSError as e:
-            log.warning('Failed to connect to %s: OSError' % self.name)
+            log.warning('Failed to connect to %s: OSError', self.name)
             log.exception(e)
             raise ActiveConnectionException()
 
-        log.info('Established connection to %s!' % self.name)
+        log.info('Established connection to %s!', self.name)
+
+        # Start decoding notifications:
+        self._decoder_task = asyncio.create_task(self._decode_loop())
 
         # Enable notifications for all characteristics:
         for char in self.config.characteristics:
-            # Generate a wrapper around the callback function to pass characteristic along.
-            callback_wrapper = functools.partial(self._notif_callback, char=char)
-            await con.start_notify(char.uuid, callback_wrapper)
+            await con.start_notify(char.uuid, _NotifDispatcher(self, char))
 
-        log.info('Enabled notifications for all characteristic for %s!' % self.name)
+        log.info('Enabled notifications for all characteristic for %s!', self.name)
         self.state = ConnectionState.CONNECTED
 
-    async def _check_for_timeout(self) -> None:
-        log = logging.getLogger('log')
-
-        for char in self.config.characteristics:
-            if char.timeout is not None:
-                last_notif = self.last_notif[char.uuid]
+    async def _check_for_timeout(self) -> Union[None, float]:
+        """
+        Disconnects if any characteristic timeout expired.
+        Returns the time (in seconds) until the next timeout could expire, or
+        None if there is no pending timeout.
+        """
+        next_timeout_ns = None
+        now_ns = time.monotonic_ns()
+
+        for char in self._timed_chars:
+            last_notif = self.last_notif[char.idx]
+
+            if last_notif is not None:
+                # Check if normal timeout expired
+                timeout_ns = char.timeout_ns
+                has_been_ns = now_ns - last_notif
+
+                if has_been_ns > timeout_ns:
+                    log.warning('%s: Timeout for characteristic %s expired, disconnecting..',
+                                self.name, char.name)
+                    await self._do_disconnect()
+                    raise ActiveConnectionException()
 
-                if last_notif is not None:
-                    # Check if normal timeout expired
-                    timeout = char.timeout
-                    has_been = (time.monotonic_ns() - last_notif)/1e9
+                remaining_ns = timeout_ns - has_been_ns
+            else:
+                # No notification yet. The first notification does not wake up the main
+                # loop, so re-check at least once per characteristic timeout:
+                remaining_ns = char.timeout_ns
 
-                    if has_been > timeout:
-                        log.warning('%s: Timeout for characteristic %s expired, disconnecting..' %
-                                    (self.name, char.name))
-                        await self._do_disconnect()
-                        raise ActiveConnectionException()
-
-                elif self.config.initial_characteristic_timeout is not None:
+                if self._initial_timeout_ns is not None:
                     if self.initial_connection_time is None:
                         raise Exception("Implementation error")
 
                     # Check if initial timeout expired
-                    timeout = char.timeout + self.config.initial_characteristic_timeout
-                    has_been = (time.monotonic_ns() - self.initial_connection_time) / 1e9
+                    timeout_ns = char.timeout_ns + self._initial_timeout_ns
+                    has_been_ns = now_ns - self.initial_connection_time
 
-                    if has_been > timeout:
-                        log.warning('%s: Never received a notification for %s, disconnecting...' %
-                                    (self.name, char.name))
+                    if has_been_ns > timeout_ns:
+                        log.warning('%s: Never received a notification for %s, disconnecting...',
+                                    self.name, char.name)
                         await self._do_disconnect()
+                        return 0
 
-    def _disconnected_callback(self, _) -> None:
-        self.did_disconnect = True
+                    remaining_ns = min(remaining_ns, timeout_ns - has_been_ns)
 
-    def _notif_callback(self, dev: BleakGATTCharacteristic, data: bytearray, char: Characteristic) -> None:
-        _ = dev
+            if next_timeout_ns is None or remaining_ns < next_timeout_ns:
+                next_timeout_ns = remaining_ns
 
-        self.last_notif[char.uuid] = time.monotonic_ns()
+        if next_timeout_ns is None:
+            return None
+        return next_timeout_ns / 1e9
 
-        # Decode and package data:
-        try:
-            decoded_data = char.data_decoder(data)
-            if len(decoded_data) == 0:
-                return
-            result = NotifData(self.adr, self.name, char, decoded_data, data)
+    def _disconnected_callback(self, _) -> None:
+        self.did_disconnect = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _decode_loop(self) -> None:
+        while True:
+            if self._raw_q.dropped == 0:
+                batch = await self._raw_q.get_batch()
+            else:
+                # Drops are pending, make sure they get reported even if no more data arrives:
+                try:
+                    batch = await asyncio.wait_for(self._raw_q.get_batch(), timeout=drop_warn_interval_ns/1e9)
+                except asyncio.TimeoutError:
+                    batch = []
+
+            self._decode_batch(batch)
+            self._warn_dropped()
+
+    def _decode_batch(self, batch: List[Tuple[Characteristic, bytearray]]) -> None:
+        for char, data in batch:
+            # Decode and package data:
             try:
-                self.output.put_nowait(result)
-            except QueueFull:
-                self.log.error("%s failed to put data into queue!" % self.name)
-        except Exception as e:
-            self.log.error("Decoder for %s raised an exception: %s" % (char.name, str(e)))
-            self.log.exception(e)
+                decoded_data = char.data_decoder(data)
+                if len(decoded_data) == 0:
+                    continue
+                result = NotifData(self.adr, self.name, char, decoded_data, data)
+                self._put(result, char.drop_policy)
+            except Exception as e:
+                log.error("Decoder for %s raised an exception: %s", char.name, e)
+                log.exception(e)
+
+    def _warn_dropped(self, force: bool = False) -> None:
+        # Summarise dropped notifications, at most once per drop_warn_interval_ns:
+        if self._raw_q.dropped == 0:
+            return
+
+        now_ns = time.monotonic_ns()
+        if force or self._last_drop_warning is None or now_ns - self._last_drop_warning > drop_warn_interval_ns:
+            log.warning('%s: Dropped %i notifications, is the decoder keeping up?',
+                        self.name, self._raw_q.take_dropped())
+            self._last_drop_warning = now_ns
+
+    async def _stop_decoder(self) -> None:
+        if self._decoder_task is None:
+            return
+
+        self._decoder_task.cancel()
+        try:
+            await self._decoder_task
+        except asyncio.CancelledError:
+            pass
+        self._decoder_task = None
+
+        # Decode anything that arrived before the connection was closed:
+        self._decode_batch(self._raw_q.get_batch_nowait())
+        self._warn_dropped(force=True)
 
     async def _do_disconnect(self) -> None:
-        log = logging.getLogger('log')
         if self.con is not None:
             try:
                 did_disconnect = await asyncio.wait_for(self.con.disconnect(), timeout=20)
                 if did_disconnect:
-                    log.warning('Disconnected from %s.' % self.name)
+                    log.warning('Disconnected from %s.', self.name)
                 else:
-                    log.warning('Failed to disconnect from %s: Bleak Error.' % self.name)
+                    log.warning('Failed to disconnect from %s: Bleak Error.', self.name)
             except BleakDBusError:
-                log.warning('Failed to disconnect from %s: DBus Error.' % self.name)
+                log.warning('Failed to disconnect from %s: DBus Error.', self.name)
             except BleakError as e:
-                log.warning('Failed to disconnect from %s: %s' % (self.name, e))
+                log.warning('Failed to disconnect from %s: %s', self.name, e)
             except asyncio.TimeoutError:
-                log.warning('Failed to disconnect from %s: Timeout' % self.name)
+                log.warning('Failed to disconnect from %s: Timeout', self.name)
             except OSError:
-                log.warning('Failed to disconnect from %s: OSError' % self.name)
+                log.warning('Failed to disconnect from %s: OSError', self.name)
             finally:
                 self.did_disconnect = True
 
@@ -219,10 +343,13 @@ class ActiveConnection:
         if self.initial_connection_time is None:
             return "xx:xx:xx"
         else:
-            active_s = (time.monotonic_ns() - self.initial_connection_time) / 1e9
-            h = active_s // (3600)
-            active_s %= (3600)
-            min = active_s // 60
-            active_s %= 60
-            s = active_s // 1
-            return "%02i:%02i:%02i" % (h, min, s)
+            active_s = (time.monotonic_ns() - self.initial_connection_time) // 1_000_000_000
+
+            # Only re-format once per second:
+            if active_s != self._last_active_s:
+                h, rem = divmod(active_s, 3600)
+                min, s = divmod(rem, 60)
+                self._last_active_s = active_s
+                self._last_active_str = "%02i:%02i:%02i" % (h, min, s)
+
+            return self._last_active_str
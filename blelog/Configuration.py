@@ -9,8 +9,9 @@ This work is licensed under the terms of the MIT license.  For a copy, see the
 included LICENSE file or <https://opensource.org/licenses/MIT>.
 ---------------------------------
 """
-from dataclasses import dataclass
-from typing import Callable, List, Dict, Union
+import os
+from dataclasses import dataclass, field
+from typing import Callable, List, Dict, Tuple, Union
 from enum import Enum
 import enum
 
@@ -23,6 +24,12 @@ class TUI_Mode(Enum):
     CONSOLE = 1
 
 
+@enum.unique
+class DropPolicy(Enum):
+    DROP_OLDEST = 0
+    DROP_NEWEST = 1
+
+
 @dataclass
 class Characteristic:
     name: str
@@ -31,6 +38,21 @@ class Characteristic:
     column_headers: List[str]
     data_decoder: Callable
 
+    # Which data to discard if a queue is full when data from this characteristic arrives.
+    # Note that queues are shared by all characteristics, so DROP_OLDEST discards the
+    # oldest queued item, which may belong to a different characteristic:
+    drop_policy: DropPolicy = DropPolicy.DROP_OLDEST
+
+    # Timeout in integer nanoseconds, to be compared against time.monotonic_ns():
+    timeout_ns: Union[None, int] = field(init=False, repr=False)
+
+    # Position of this characteristic in the configuration, assigned by
+    # Configuration.validate_and_normalise():
+    idx: Union[None, int] = field(init=False, repr=False, default=None)
+
+    def __post_init__(self):
+        self.timeout_ns = None if self.timeout is None else int(self.timeout * 1e9)
+
 
 @dataclass
 class Configuration:
@@ -47,8 +69,8 @@ class Configuration:
     connection_timeout_scan: float
 
     # Scanner parameters:
-    scan_duration: float
-    scan_cooldown: float
+    scan_duration: float  # Unused, scanning is continuous.
+    scan_cooldown: float  # Unused, scanning is continuous.
     seen_timeout: float
     initial_characteristic_timeout: float
     mgr_interval: float
@@ -66,6 +88,13 @@ class Configuration:
     tui_mode: TUI_Mode
     curse_tui_interval: float
 
+    # Optional settings (with defaults, so existing configurations remain valid):
+    log2csv_one_file_per_device: bool = False
+
+    # CSV file path for each (device address, characteristic name) pair,
+    # precomputed by validate_and_normalise() for all known devices:
+    csv_paths: Dict[Tuple[str, str], str] = field(init=False, repr=False, default_factory=dict)
+
     def validate_and_normalise(self):
         """
         Validates the configuration provided by the user.
@@ -79,9 +108,10 @@ class Configuration:
         # normalise connect device addresses in list of aliases:
         self.device_aliases = {normalise_adr(adr): alias for adr, alias in self.device_aliases.items()}
 
-        # normalise characteristic UUIDs:
-        for char in self.characteristics:
+        # normalise characteristic UUIDs and assign indices:
+        for idx, char in enumerate(self.characteristics):
             char.uuid = normalise_char_uuid(char.uuid)
+            char.idx = idx
 
         # Check for duplicate aliases:
         # (Can cause problems, as they are used as a file name)
@@ -109,6 +139,25 @@ class Configuration:
                 exit(-1)
             seen_uuids.append(char.uuid)
 
+        # Precompute CSV file paths for all devices that are known in advance:
+        for adr in set(self.connect_device_adrs) | set(self.device_aliases.keys()):
+            for char in self.characteristics:
+                self.csv_paths[(adr, char.name)] = self.csv_file_path(adr, char)
+
+    def csv_file_path(self, device_adr: str, char: Characteristic) -> str:
+        """Determine the CSV file that data from a given device and characteristic is logged to"""
+        if device_adr in self.device_aliases:
+            name = self.device_aliases[device_adr]
+        else:
+            name = device_adr.replace(':', '_')
+
+        if self.log2csv_one_file_per_device:
+            n = "%s.csv" % name
+        else:
+            n = "%s_%s.csv" % (name, char.name)
+        n = n.replace(' ', '_')
+        return os.path.join(self.log2csv_folder_name, n)
+
     def get_characteristic(self, uuid: str) -> Characteristic:
         for c in self.characteristics:
             if c.uuid == normalise_char_uuid(uuid):
@@ -9,7 +9,6 @@ This work is licensed under the terms of the MIT license.  For a copy, see the
 included LICENSE file or <https://opensource.org/licenses/MIT>.
 ---------------------------------
 """
-from asyncio.queues import Queue
 import logging
 import asyncio
 from asyncio import Event
@@ -19,6 +18,7 @@ from typing import Union, Dict
 
 from blelog.ActiveConnection import ActiveConnection, ConnectionState
 from blelog.Configuration import Configuration
+from blelog.FastQueue import FastQueue
 from blelog.Scanner import Scanner, SeenDevice, SeenDeviceState
 
 
@@ -53,7 +53,7 @@ class ManagedConnection:
 
 
 class ConnectionMgr:
-    def __init__(self, config: Configuration, scnr: Scanner, output_queue: Queue):
+    def __init__(self, config: Configuration, scnr: Scanner, output_queue: FastQueue):
         self.config = config
         self.scnr = scnr
         self.connections = {}  # type: Dict[str, ManagedConnection]
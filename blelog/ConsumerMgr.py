@@ -14,16 +14,22 @@ import asyncio
 import logging
 import time
 from abc import ABC, abstractmethod
-from asyncio import Event, Queue
-from asyncio.queues import QueueFull
+from asyncio import Event
 from dataclasses import dataclass
 from typing import Any, List, Union
 
 from blelog.Configuration import Characteristic, Configuration
+from blelog.FastQueue import FastQueue
 
 warn_thsh = 300
 warn_timeout_ns = 60e9
 
+# Maximum number of items waiting to be distributed to consumers:
+input_q_maxsize = 10000
+
+# Minimum time between warnings about dropped data:
+drop_warn_interval_ns = 1e9
+
 
 class Consumer(ABC):
     """
@@ -31,7 +37,7 @@ class Consumer(ABC):
     """
 
     def __init__(self) -> None:
-        self.input_q = Queue()
+        self.input_q = FastQueue()
         self.last_full_queue_warning = None  # type: Union[int, None]
 
     @abstractmethod
@@ -59,7 +65,8 @@ class ConsumerMgr:
         self.config = config
         self.consumers = []  # type: List[Consumer]
         self.consumer_tasks = []
-        self.input_q = Queue()
+        self.input_q = FastQueue(maxsize=input_q_maxsize)
+        self.last_drop_warning = None  # type: Union[int, None]
 
     def add_consumer(self, c: Consumer):
         self.consumers.append(c)
@@ -73,6 +80,7 @@ class ConsumerMgr:
             while not (halt.is_set() and self.input_q.empty()):
                 await self._distribute_data()
                 self._monitor_timeouts()
+                self._monitor_dropped()
 
         except Exception as e:
             log.error('ConsumerMgr encountered an exception: %s' % str(e))
@@ -93,20 +101,29 @@ class ConsumerMgr:
             log.info('Consumer %s enabled!' % consumer.__class__.__name__)
 
     async def _distribute_data(self):
-        log = logging.getLogger('log')
         try:
             # Grab data, distribute to all consumers:
-            next_data = await asyncio.wait_for(self.input_q.get(), timeout=0.5)
-            for consumer in self.consumers:
-                try:
+            batch = await asyncio.wait_for(self.input_q.get_batch(), timeout=0.5)
+            # (Consumer queues are unbounded, so this never drops data)
+            for next_data in batch:
+                for consumer in self.consumers:
                     consumer.input_q.put_nowait(next_data)
-                except QueueFull:
-                    log.warning('Consumer %s did not accept data!' % type(consumer).__name__)
-            self.input_q.task_done()
 
         except asyncio.TimeoutError:
             pass
 
+    def _monitor_dropped(self):
+        log = logging.getLogger('log')
+        # Summarise data dropped because the input queue was full:
+        if self.input_q.dropped == 0:
+            return
+
+        now_ns = time.monotonic_ns()
+        if self.last_drop_warning is None or now_ns - self.last_drop_warning > drop_warn_interval_ns:
+            log.warning('ConsumerMgr dropped %i notifications, are the consumers keeping up?'
+                        % self.input_q.take_dropped())
+            self.last_drop_warning = now_ns
+
     def _monitor_timeouts(self):
         log = logging.getLogger('log')
         # Check if any consumers are lagging behind:
@@ -0,0 +1,75 @@
+"""
+blelog/FastQueue.py
+Lightweight queue used to pass data between tasks on the notification path.
+
+BLELog
+Copyright (C) 2024 Philipp Schilk
+
+This work is licensed under the terms of the MIT license.  For a copy, see the
+included LICENSE file or <https://opensource.org/licenses/MIT>.
+---------------------------------
+"""
+import collections
+from asyncio import Event
+from asyncio.queues import QueueFull
+from typing import Any, List, Union
+
+from blelog.Configuration import DropPolicy
+
+
+class FastQueue:
+    """
+    Single-consumer replacement for asyncio.Queue.
+    Items are kept in a deque, and the consumer is woken up by an Event.
+    Instead of retrieving single items, the consumer always grabs everything
+    that is currently waiting.
+
+    If a drop policy is given when putting into a full queue, an item is discarded
+    and counted in `dropped` instead of raising QueueFull. The policy applies to the
+    queue as a whole: DROP_OLDEST discards the oldest item, whoever put it there.
+    """
+
+    def __init__(self, maxsize: int = 0) -> None:
+        self._dq = collections.deque()
+        self._ev = Event()
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def put_nowait(self, item: Any, drop_policy: Union[None, DropPolicy] = None) -> None:
+        if self.maxsize > 0 and len(self._dq) >= self.maxsize:
+            if drop_policy is None:
+                raise QueueFull()
+
+            self.dropped += 1
+            if drop_policy == DropPolicy.DROP_NEWEST:
+                return
+            self._dq.popleft()
+
+        self._dq.append(item)
+        self._ev.set()
+
+    def take_dropped(self) -> int:
+        """Return the number of items dropped since the last call"""
+        dropped = self.dropped
+        self.dropped = 0
+        return dropped
+
+    async def get_batch(self) -> List[Any]:
+        """Wait until at least one item is available, and return all waiting items"""
+        while len(self._dq) == 0:
+            self._ev.clear()
+            await self._ev.wait()
+        return self.get_batch_nowait()
+
+    def get_batch_nowait(self) -> List[Any]:
+        """Return all waiting items, which may be none"""
+        batch = list(self._dq)
+        self._dq.clear()
+        self._ev.clear()
+        return batch
+
+    def qsize(self) -> int:
+        return len(self._dq)
+
+    def empty(self) -> bool:
+        return len(self._dq) == 0
@@ -1,6 +1,6 @@
 """
 blelog/Scanner.py
-Repeatedly scans for new devices.
+Continuously scans for new devices.
 
 BLELog
 Copyright (C) 2024 Philipp Schilk
@@ -18,7 +18,7 @@ import time
 from asyncio import Event
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, Tuple, Union
+from typing import Dict, Union
 
 from bleak import BleakScanner
 from bleak.backends.device import BLEDevice
@@ -27,6 +27,14 @@ from bleak.backends.scanner import AdvertisementData
 from blelog.Configuration import Configuration
 from blelog.Util import normalise_adr
 
+log = logging.getLogger('log')
+
+# Time (in seconds) between checks for seen-recently timeouts:
+seen_check_interval_s = 0.5
+
+# Maximum time (in seconds) starting or stopping the scanner can take:
+scanner_timeout_s = 15
+
 
 @enum.unique
 class SeenDeviceState(Enum):
@@ -39,6 +47,9 @@ class SeenDeviceState(Enum):
 
 @dataclass
 class SeenDevice:
+    # Explicit slots instead of dataclass(slots=True), which requires Python 3.10:
+    __slots__ = ('adr', 'alias', 'state', 'name', 'last_seen', 'rssi')
+
     adr: str
     alias: Union[str, None]
 
@@ -61,8 +72,22 @@ class Scanner:
 
         self.name_regexes = [re.compile(r) for r in config.connect_device_name_regexes]
 
+        # Combine all name regexes into a single pattern, so each name only has to be matched once.
+        # Only done if no pattern contains groups (which could clash, or change the meaning of
+        # numbered backreferences) or inline flags (which would apply to the whole combined
+        # pattern before Python 3.11), and if the combined pattern compiles:
+        self.name_regex = None
+        if len(self.name_regexes) > 1 and all(r.groups == 0 and r.flags == re.UNICODE
+                                              for r in self.name_regexes):
+            try:
+                self.name_regex = re.compile('|'.join('(?:%s)' % r for r in config.connect_device_name_regexes))
+            except re.error:
+                pass
+
         self.seen_devices = {}  # type: Dict[str, SeenDevice]
 
+        self._seen_timeout_ns = int(config.seen_timeout * 1e9)
+
         # Pre-populate with all devices with fixed/pre-specified address:
         for adr in config.connect_device_adrs:
             self.seen_devices[adr] = SeenDevice(
@@ -76,63 +101,80 @@ class Scanner:
             )
 
     async def run(self, halt: Event):
-        log = logging.getLogger('log')
+        scanner = None
         try:
+            # Scan continuously, handling each advertisement as it arrives:
+            scanner = BleakScanner(detection_callback=self._on_adv)
             while not halt.is_set():
-                # Scan
                 try:
-                    devices = await asyncio.wait_for(
-                        BleakScanner.discover(timeout=self.config.scan_duration, return_adv=True),
-                        timeout=15)
-
-                    t = time.monotonic_ns()
+                    await asyncio.wait_for(scanner.start(), timeout=scanner_timeout_s)
+                    break
+                except asyncio.TimeoutError:
+                    log.warning('Scanner time out...')
 
-                    # Update list of seen devices:
-                    self._update_seen_devices(devices, t)
+            while not halt.is_set():
+                self._expire_seen_devices()
 
-                    # Cooldown
-                    await asyncio.sleep(self.config.scan_cooldown)
+                try:
+                    await asyncio.wait_for(halt.wait(), timeout=seen_check_interval_s)
                 except asyncio.TimeoutError:
-                    log.warning('Scanner time out...')
+                    pass
         except Exception as e:
-            log.error('Scanner encountered an exception: %s' % str(e))
+            log.error('Scanner encountered an exception: %s', e)
             log.exception(e)
             halt.set()
         finally:
+            if scanner is not None:
+                try:
+                    await asyncio.wait_for(scanner.stop(), timeout=scanner_timeout_s)
+                except asyncio.TimeoutError:
+                    log.warning('Scanner time out...')
+                except Exception as e:
+                    log.warning('Failed to stop scanner: %s', e)
             print('Scanner shut down...')
 
-    def _update_seen_devices(self, devices: Dict[str, Tuple[BLEDevice, AdvertisementData]], t: int):
-        for scanned_dev, adv_data in devices.values():
-            adr = normalise_adr(scanned_dev.address)
-
-            if adr in self.seen_devices:
-                # Known device, update information:
-                dev = self.seen_devices[adr]
-                dev.last_seen = t
-                dev.name = scanned_dev.name
-                dev.rssi = adv_data.rssi
-                dev.state = SeenDeviceState.RECENTLY_SEEN
-            else:
-                # Unknown device, check if name matches:
-                for r in self.name_regexes:
-                    if (scanned_dev.name is None):
-                        continue
-                    if r.match(scanned_dev.name):
-                        # It does, add the new device:
-                        new_dev = SeenDevice(
-                            adr=adr,
-                            alias=self.config.device_aliases.get(adr, None),
-                            state=SeenDeviceState.RECENTLY_SEEN,
-                            name=scanned_dev.name,
-                            last_seen=t,
-                            rssi=adv_data.rssi,
-                        )
-                        self.seen_devices[adr] = new_dev
+    def _on_adv(self, scanned_dev: BLEDevice, adv_data: AdvertisementData):
+        adr = normalise_adr(scanned_dev.address)
+
+        dev = self.seen_devices.get(adr)
+        if dev is not None:
+            # Known device, update information:
+            dev.last_seen = time.monotonic_ns()
+            dev.name = scanned_dev.name
+            dev.rssi = adv_data.rssi
+            dev.state = SeenDeviceState.RECENTLY_SEEN
+        else:
+            # Unknown device, check if name matches:
+            if scanned_dev.name is None:
+                return
+            if self._name_matches(scanned_dev.name):
+                # It does, add the new device:
+                new_dev = SeenDevice(
+                    adr=adr,
+                    alias=self.config.device_aliases.get(adr, None),
+                    state=SeenDeviceState.RECENTLY_SEEN,
+                    name=scanned_dev.name,
+                    last_seen=time.monotonic_ns(),
+                    rssi=adv_data.rssi,
+                )
+                self.seen_devices[adr] = new_dev
+
+    def _name_matches(self, name: str) -> bool:
+        if self.name_regex is not None:
+            return self.name_regex.match(name) is not None
+        for r in self.name_regexes:
+            if r.match(name):
+                return True
+        return False
+
+    def _expire_seen_devices(self):
+        RECENTLY_SEEN = SeenDeviceState.RECENTLY_SEEN
 
         # Check for seen-recently timeouts:
+        now_ns = time.monotonic_ns()
+        seen_timeout_ns = self._seen_timeout_ns
         for dev in self.seen_devices.values():
-            if dev.state == SeenDeviceState.RECENTLY_SEEN:
+            if dev.state == RECENTLY_SEEN:
                 if dev.last_seen is not None:
-                    has_been = (time.monotonic_ns() - dev.last_seen)/1e9
-                    if has_been > self.config.seen_timeout:
+                    if now_ns - dev.last_seen > seen_timeout_ns:
                         dev.state = SeenDeviceState.NOT_SEEN
@@ -14,72 +14,154 @@ import csv
 import io
 import logging
 import os
+import time
 from asyncio.locks import Event
-from asyncio.queues import Queue
-from typing import List
-
-import aiofiles
+from typing import Any, BinaryIO, Dict, List, Union
 
 from blelog.Configuration import Configuration
 from blelog.ConsumerMgr import Consumer, NotifData
+from blelog.FastQueue import FastQueue
+
+log = logging.getLogger('log')
+
+# Encoded rows are buffered and only handed to the file once the buffer
+# grows beyond this size, or this much time has passed since the last write:
+buffer_size = 1 << 16
+flush_interval_ns = 250e6
+
+# Line terminator used by csv.writer:
+line_terminator = '\r\n'
 
 
 class CSVLogger:
-    def __init__(self, file_path: str, column_headers: List[str]):
+    def __init__(self, file_path: str, column_headers: List[str],
+                 char_columns: Union[None, Dict[str, List[int]]] = None):
         self.file_path = file_path
-        self.input_q = Queue()
+        self.input_q = FastQueue()
         self.column_headers = column_headers
         self.active = True
 
+        # If set, the file combines multiple characteristics. Maps each characteristic
+        # name to the column index of each of its values:
+        self.char_columns = char_columns
+
+        # Re-used csv.writer that all rows are encoded with:
+        self._csv_buf = io.StringIO()
+        self._csv_writer = csv.writer(self._csv_buf, lineterminator=line_terminator)
+
+        # Output file and encoded rows not yet written to it:
+        self._f = None  # type: Union[BinaryIO, None]
+        self._buf = bytearray()
+        self._last_flush = time.monotonic_ns()
+
     async def run(self, halt: Event):
-        log = logging.getLogger('log')
-        f = None
+        loop = asyncio.get_running_loop()
 
         try:
-            if os.path.exists(self.file_path):
-                f = await aiofiles.open(self.file_path, 'a', newline='')
-                # log.info('Opened %s' % self.file_path)
-            else:
-                f = await aiofiles.open(self.file_path, 'w', newline='')
-                await self.write_row(f, self.column_headers)
-                # log.info('Created %s' % self.file_path)
+            is_new_file = not os.path.exists(self.file_path)
+            self._f = await loop.run_in_executor(None, open, self.file_path, 'ab')
+
+            if is_new_file:
+                self.write_row(self.column_headers)
+                # log.info('Created %s', self.file_path)
 
             while not (halt.is_set() and self.input_q.empty()):
                 try:
-                    next_data = await asyncio.wait_for(self.input_q.get(), timeout=0.5)  # type: NotifData
-                    await self.write_rows(f, next_data.data)
-                    await f.flush()
-                    self.input_q.task_done()
+                    batch = await asyncio.wait_for(self.input_q.get_batch(), timeout=flush_interval_ns/1e9)
+                    self.write_many(batch)
                 except asyncio.TimeoutError:
                     pass
+
+                if self._should_flush():
+                    await self._flush()
         except FileNotFoundError as e:
-            log.error('CSVLogger %s encountered an exception: %s' % (self.file_path, str(e)))
+            log.error('CSVLogger %s encountered an exception: %s', self.file_path, e)
             log.exception(e)
         except Exception as e:
-            log.error('CSVLogger %s encountered an exception: %s' % (self.file_path, str(e)))
+            log.error('CSVLogger %s encountered an exception: %s', self.file_path, e)
             log.exception(e)
             halt.set()
         finally:
             self.active = False
-            if f is not None:
-                await f.close()
+            if self._f is not None:
+                await self._close()
             # print('CSVLogger %s shut down...' % self.file_path)
 
-    async def write_row(self, f, row):
-        row_str_io = io.StringIO()
-        csv_writer = csv.writer(row_str_io)
-        csv_writer.writerow(row)
-
-        await f.write(row_str_io.getvalue())
-
-    async def write_rows(self, f, rows):
-        row_str_io = io.StringIO()
-        csv_writer = csv.writer(row_str_io)
-
-        for row in rows:
-            csv_writer.writerow(row)
+    def write_row(self, row):
+        self._buf += self._encode_csv([row]).encode()
+
+    def write_rows(self, rows):
+        if len(rows) == 0:
+            return
+
+        self._buf += self._encode_csv(rows).encode()
+
+    def write_many(self, batch: List[NotifData]):
+        if self.char_columns is not None:
+            self.write_rows(self._combined_rows(batch))
+            return
+
+        rows = []
+        for next_data in batch:
+            rows.extend(next_data.data)
+
+        self.write_rows(rows)
+
+    def _combined_rows(self, batch: List[NotifData]) -> List[List[Any]]:
+        rows = []
+        width = len(self.column_headers)
+
+        for next_data in batch:
+            char_name = next_data.characteristic.name
+            columns = self.char_columns[char_name]
+
+            for row in next_data.data:
+                combined_row = [''] * width
+                combined_row[0] = char_name
+                for col, val in zip(columns, row):
+                    combined_row[col] = val
+                rows.append(combined_row)
+
+        return rows
+
+    def _should_flush(self) -> bool:
+        if len(self._buf) == 0:
+            return False
+        if len(self._buf) >= buffer_size:
+            return True
+        return time.monotonic_ns() - self._last_flush > flush_interval_ns
+
+    async def _flush(self):
+        # Hand the buffer to a worker thread in one go:
+        data = bytes(self._buf)
+        self._buf.clear()
+        self._last_flush = time.monotonic_ns()
+        await asyncio.get_running_loop().run_in_executor(None, self._write_out, data)
+
+    async def _close(self):
+        data = bytes(self._buf)
+        self._buf.clear()
+        await asyncio.get_running_loop().run_in_executor(None, self._write_out_and_close, data)
+
+    def _write_out(self, data: bytes):
+        # Rows are already batched in self._buf, so the file's own buffer is only
+        # flushed to hand each batch to the OS right away:
+        self._f.write(data)
+        self._f.flush()
+
+    def _write_out_and_close(self, data: bytes):
+        try:
+            self._write_out(data)
+            os.fsync(self._f.fileno())
+        finally:
+            self._f.close()
 
-        await f.write(row_str_io.getvalue())
+    def _encode_csv(self, rows) -> str:
+        self._csv_writer.writerows(rows)
+        result = self._csv_buf.getvalue()
+        self._csv_buf.seek(0)
+        self._csv_buf.truncate()
+        return result
 
 
 class Consumer_log2csv(Consumer):
@@ -89,19 +171,28 @@ class Consumer_log2csv(Consumer):
         self.file_outputs = {}
         self.tasks = []
 
-    async def run(self, halt: Event):
-        log = logging.getLogger('log')
+        # Layout of combined per-device files:
+        if config.log2csv_one_file_per_device:
+            self._device_headers = ['characteristic']
+            self._char_columns = {}  # type: Dict[str, List[int]]
+            for char in config.characteristics:
+                for header in char.column_headers:
+                    if header not in self._device_headers:
+                        self._device_headers.append(header)
+                self._char_columns[char.name] = [self._device_headers.index(h) for h in char.column_headers]
 
+    async def run(self, halt: Event):
         try:
             while not (halt.is_set() and self.input_q.empty()):
                 try:
-                    next_data = await asyncio.wait_for(self.input_q.get(), timeout=0.5)  # type: NotifData
-                    await self._log_to_file(next_data, halt)
+                    batch = await asyncio.wait_for(self.input_q.get_batch(), timeout=0.5)
+                    for next_data in batch:
+                        self._log_to_file(next_data, halt)
                 except asyncio.TimeoutError:
                     pass
 
         except Exception as e:
-            log.error('Consumer log2csv encountered an exception: %s' % str(e))
+            log.error('Consumer log2csv encountered an exception: %s', e)
             log.exception(e)
             halt.set()
         finally:
@@ -111,28 +202,28 @@ class Consumer_log2csv(Consumer):
             await asyncio.gather(*self.tasks)
             print('Consumer log2csv shut down...')
 
-    async def _log_to_file(self, next_data: NotifData, halt: Event):
+    def _log_to_file(self, next_data: NotifData, halt: Event):
         # determine file path:
-        file_path = self.file_path(next_data.device_adr, next_data.characteristic)
+        # (Only devices discovered via name regex are not yet known to the configuration)
+        key = (next_data.device_adr, next_data.characteristic.name)
+        try:
+            file_path = self.config.csv_paths[key]
+        except KeyError:
+            file_path = self.config.csv_file_path(next_data.device_adr, next_data.characteristic)
+            self.config.csv_paths[key] = file_path
 
-        if file_path not in self.file_outputs:
+        file_output = self.file_outputs.get(file_path)
+
+        if file_output is None:
             # File not yet opened, open:
-            file_output = CSVLogger(file_path, next_data.characteristic.column_headers)
+            if self.config.log2csv_one_file_per_device:
+                file_output = CSVLogger(file_path, self._device_headers, self._char_columns)
+            else:
+                file_output = CSVLogger(file_path, next_data.characteristic.column_headers)
             self.file_outputs[file_path] = file_output
-            file_task = asyncio.create_task(self.file_outputs[file_path].run(halt))
+            file_task = asyncio.create_task(file_output.run(halt))
             self.tasks.append(file_task)
 
-        if self.file_outputs[file_path].active:
+        if file_output.active:
             # Open, write:
-            await self.file_outputs[file_path].input_q.put(next_data)
-
-    def file_path(self, device_adr, char):
-        if device_adr in self.config.device_aliases:
-            name = self.config.device_aliases[device_adr]
-        else:
-            name = device_adr
-            name = device_adr.replace(':', '_')
-
-        n = "%s_%s.csv" % (name, char.name)
-        n = n.replace(' ', '_')
-        return os.path.join(self.config.log2csv_folder_name, n)
+            file_output.input_q.put_nowait(next_data)
@@ -21,6 +21,7 @@ import signal
 from asyncio.locks import Event
 from logging import LogRecord
 from logging.handlers import QueueHandler
+from typing import List
 
 from blelog.Configuration import Configuration
 from blelog.ConsumerMgr import Consumer, NotifData
@@ -124,11 +125,13 @@ class Consumer_plotter(Consumer):
         log = logging.getLogger('log')
         try:
             # Wait for new data:
-            next_data = await asyncio.wait_for(self.input_q.get(), timeout=0.5)  # type: NotifData
-            self.input_q.task_done()
+            batch = await asyncio.wait_for(self.input_q.get_batch(), timeout=0.5)  # type: List[NotifData]
+
+            for next_data in batch:
+                # Try to pass the data to the plotting process if there is one
+                if self.plotting_process is None:
+                    break
 
-            # Try to pass the data to the plotting process if there is one
-            if self.plotting_process is not None:
                 attempts = 0
                 while attempts < 10:
                     try:
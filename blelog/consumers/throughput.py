@@ -14,6 +14,7 @@ import asyncio
 import logging
 import time
 from asyncio.locks import Event
+from typing import List
 
 from blelog.Configuration import Configuration
 from blelog.ConsumerMgr import Consumer, NotifData
@@ -44,13 +45,13 @@ class Consumer_throughput(Consumer):
 
         # Receive more data:
         try:
-            next_data = await asyncio.wait_for(self.input_q.get(), timeout=0.5)  # type: NotifData
-            self.input_q.task_done()
+            batch = await asyncio.wait_for(self.input_q.get_batch(), timeout=0.5)  # type: List[NotifData]
 
             if self.meas_period_start is None:
                 self.meas_period_start = time.monotonic()
 
-            self.meas_period_total_bits += len(next_data.data_raw)*8
+            for next_data in batch:
+                self.meas_period_total_bits += len(next_data.data_raw)*8
 
         except asyncio.TimeoutError:
             pass
@@ -56,7 +56,7 @@ class Connections_TUI(CursesTUI_Component):
             conn_time_row.append(con.active_connection.active_time_str())
 
             for char in self.config.characteristics:
-                t_ns = con.active_connection.last_notif[char.uuid]
+                t_ns = con.active_connection.last_notif[char.idx]
                 if t_ns is not None:
                     t = str(round((time.monotonic_ns() - t_ns)/1e9, 2))
                 else:
@@ -109,9 +109,15 @@ And use it to print:
     ```
 """
 import logging
-import struct
 from typing import Any, List
 
+import numpy as np
+
+# A single demo_char reading: a 16-bit little-endian unsigned index
+# followed by a 16-bit little-endian signed value.
+# (See https://numpy.org/doc/stable/user/basics.rec.html)
+demo_char_dtype = np.dtype([('idx', '<u2'), ('data', '<i2')])
+
 
 def decode_demo_char(data: bytearray) -> List[List[Any]]:
     # Each notification consists of 50 readings, with each
@@ -130,15 +136,9 @@ def decode_demo_char(data: bytearray) -> List[List[Any]]:
         log.warning('Malformed demo data, rejecting...')
         return []
 
-    # Decode:
-    result = []
-
-    for i in range(50):
-        # Grab 4 bytes for sample at position i
-        row_bytes = data[4*i:4*i+4]
-        # Decode:
-        # (See https://docs.python.org/3/library/struct.html)
-        idx_val, data_val = struct.unpack('<Hh', row_bytes)
-        result.append([idx_val, data_val])
+    # Decode all 50 readings at once, instead of unpacking them one by one
+    # in a python loop:
+    readings = np.frombuffer(data, dtype=demo_char_dtype)
 
-    return result
+    # Combine into rows of [idx, data]:
+    return np.stack([readings['idx'], readings['data']], axis=1).tolist()
@@ -9,7 +9,7 @@ This work is licensed under the terms of the MIT license.  For a copy, see the
 included LICENSE file or <https://opensource.org/licenses/MIT>.
 ---------------------------------
 """
-from blelog.Configuration import Characteristic, Configuration, TUI_Mode
+from blelog.Configuration import Characteristic, Configuration, DropPolicy, TUI_Mode
 from char_decoders import *
 
 config = Configuration(
@@ -62,8 +62,16 @@ config = Configuration(
 
             # Column names for the information returned by the decoder function:
             # See `char_decoders.py` for more infos.
-            column_headers=['idx', 'data']
-
+            column_headers=['idx', 'data'],
+
+            # Drop policy (optional):
+            # If BLELog cannot keep up and an internal queue is full when a
+            # notification for this characteristic arrives, either the oldest
+            # queued data (DROP_OLDEST, default) or this notification
+            # (DROP_NEWEST) is discarded.
+            # Queues are shared by all characteristics of a device, so the
+            # oldest queued data may belong to a different characteristic.
+            drop_policy=DropPolicy.DROP_OLDEST,
         ),
 
         # ... Additional characteristics
@@ -96,11 +104,10 @@ config = Configuration(
     mgr_interval=1,
 
     # ================== Scanner Parameters ======================
-    # Time, in seconds, a scan should last:
-    # Increasing this may help if devices are not being discovered:
+    # Scan duration and cooldown:
+    # Unused, as the scanner now runs continuously and picks up
+    # each advertisement as it arrives. Kept for compatibility.
     scan_duration=3,
-
-    # Time, in seconds, to pause between scans:
     scan_cooldown=0.1,
 
     # Last-seen timeout:
@@ -118,6 +125,13 @@ config = Configuration(
     # fail. BLElog will *not* attempt to create it!
     log2csv_folder_name="output_csv",
 
+    # Log all characteristics of a device into a single CSV file (optional):
+    # The file contains a 'characteristic' column, followed by the union of
+    # all characteristics' column headers. Columns that do not belong to a
+    # row's characteristic are left empty.
+    # If disabled, each characteristic of each device gets its own file.
+    log2csv_one_file_per_device=False,
+
     # Automatically open the data plot GUI on startup:
     # Useful in 'CONSOLE' tui mode, as the plotter cannot
     # be manually opened.